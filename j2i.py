@@ -1,24 +1,54 @@
-#! /usr/bin/env python
-# -*- coding: utf-8 -*-
+#! /usr/bin/env python3
 
 import argparse
 import os
-from ruamel.yaml import YAML
-from ruamel.yaml.comments import CommentedMap
-import jinja2
-from zipfile import ZipFile
-from StringIO import StringIO
-import shutil
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
 import sys
 import uuid
-import netaddr
 import hashlib
+import functools
+import itertools
+import string
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
-JINJA2_FILE_EXTENSIONS = ['.j2', '.jinja2']
+JINJA2_FILE_EXTENSIONS = frozenset(['.j2', '.jinja2'])
 
+# the namespace used to generate the UUID5 values
+UUID5_NAMESPACE = uuid.NAMESPACE_DNS
 
-yaml = YAML()
+# the characters allowed in a linux interface name (besides the non ascii
+# alphanumeric ones) and a translation table deleting all the other
+# ascii characters
+LINUX_IF_NAME_CHARS = frozenset(string.ascii_letters + string.digits + '-_')
+LINUX_IF_NAME_DEL_TABLE = str.maketrans(
+    '', '', ''.join(chr(i) for i in range(128)
+                    if chr(i) not in LINUX_IF_NAME_CHARS))
+
+# the buffer size used when reading the input yaml file and the max size
+# of an input file that is read in one go instead of streamed to the parser
+INPUT_BUFFER_SIZE = 1 << 20
+INPUT_READ_ALL_MAX_SIZE = 16 << 20
+
+# the kinds of content saved in the output zip file: a file copied as it is
+# (e.g. one listed in .j2i_ignore) or the rendered output of a template
+CONTENT_FILE = 'file'
+CONTENT_RENDERED = 'rendered'
+
+# the buffer size used when writing the output zip file
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# the number of (non empty) chunks of a rendered template that are joined
+# together before being written to the output zip file
+TEMPLATE_STREAM_BUFFER_SIZE = 64
+
+# the ZipInfo attribute holding the compression level of an entry: public
+# since python 3.13, only available as a private attribute before that
+ZIPINFO_COMPRESS_LEVEL_ATTR = ('compress_level'
+                               if hasattr(ZipInfo(), 'compress_level')
+                               else '_compresslevel')
 
 
 def main(input_args):
@@ -40,32 +70,82 @@ def main(input_args):
                         help='the name/path to the output zip file.'
                              'Default: j2i_output.zip')
 
+    parser.add_argument('--compresslevel',
+                        dest="compresslevel",
+                        type=int,
+                        choices=range(10),
+                        metavar='{0-9}',
+                        default=1,
+                        help='the compression level used for the output '
+                             'zip file, from 0 (none) to 9 (best). '
+                             'Default: 1')
+
+    parser.add_argument('-j', '--jobs',
+                        dest="jobs",
+                        type=int,
+                        default=1,
+                        help='the number of threads used to render the '
+                             'templates, 0 to use one per CPU. Default: 1')
+
+    parser.add_argument('--bytecode-cache-dir',
+                        dest="bytecode_cache_dir",
+                        help='the directory where the compiled templates are '
+                             'cached between runs. Default: a per user '
+                             'directory in the system temp dir')
+
+    parser.add_argument('--no-bytecode-cache',
+                        dest="bytecode_cache",
+                        action='store_false',
+                        help='do not cache the compiled templates '
+                             'between runs')
+
     parser.add_argument('--version', action='version', version='0.1')
 
     args = parser.parse_args(input_args)
+    if args.jobs < 0:
+        parser.error("the number of jobs cannot be negative")
+    if args.jobs == 0:
+        args.jobs = os.cpu_count() or 1
 
     try:
         # parse the templates dirs and extract the templates keys
         templates = get_all_templates(args.templates_dir)
         assert templates, "No templates found in {}".format(args.templates_dir)
 
-        # create a custom tag constructor for each template key
-        for key in templates.keys():
-            yaml.Constructor.add_constructor(u'!{}'.format(key), obj_constructor)
+        # accept a custom tag for each template key
+        _get_yaml().Constructor.obj_kinds = frozenset(templates)
 
         # open and parse the input yaml
-        with open(args.input_file) as f:
-            params = yaml.load(f)
+        params = load_input(args.input_file)
 
-        content = gen_content(params, args.templates_dir)
+        content = gen_content(params,
+                              args.templates_dir,
+                              args.jobs,
+                              args.bytecode_cache,
+                              args.bytecode_cache_dir)
     except BaseException:
         raise
     else:
-        output_file_path = write_content(content, args.output_file)
+        output_file_path = write_content(content,
+                                         args.output_file,
+                                         args.compresslevel)
         print("Done! Output saved to: {0}".format(output_file_path))
 
 
-def gen_content(params, templates_dir_path):
+def load_input(input_file_path):
+    """Load the input yaml file. Files up to INPUT_READ_ALL_MAX_SIZE are read
+    with a single read() call, bigger ones are streamed to the parser"""
+    with open(input_file_path, 'rb', buffering=INPUT_BUFFER_SIZE) as f:
+        if os.fstat(f.fileno()).st_size <= INPUT_READ_ALL_MAX_SIZE:
+            return _get_yaml().load(f.read())
+        return _get_yaml().load(f)
+
+
+def gen_content(params, templates_dir_path, jobs=1,
+                bytecode_cache=True, bytecode_cache_dir=None):
+    """Render the templates for all the objects defined in params.
+    This is a generator yielding (file path, content) pairs as soon as each
+    template is rendered, so the rendered files are not all kept in memory"""
 
     # parse the templates dirs and extract the templates keys
     templates = get_all_templates(templates_dir_path)
@@ -74,78 +154,127 @@ def gen_content(params, templates_dir_path):
     # get the files are supposed to be ignored (not rendered with jinja2)
     to_ignore = get_files_to_be_ignored(templates_dir_path)
 
-    # find the configured key name for all the Obj defined
-    # Note: the objects are expected to be defined at the top level only
-    # TODO: maybe add support for nested objects
-    objs = {k: v for k, v in params.items() if issubclass(v.__class__, Obj)}
-
-    # inject the object names and kind into the objects before the objects
-    # are used in the rendering so that the updated object is used via anchors
-    for name, obj in objs.items():
-        kind = obj.__class__.__name__
-        # add the name and kind as attributes to the obj
+    # each (object, template) pair can be rendered independently.
+    # Each of the templates used by the objects is compiled only once, before
+    # rendering anything. The files to be ignored are not compiled (None)
+    compiled = {}
+    tasks = []
+    for name, obj in params.items():
+        # find the configured key name for all the Obj defined
+        # Note: the objects are expected to be defined at the top level only
+        # TODO: maybe add support for nested objects
+        if not isinstance(obj, Obj):
+            continue
+        # inject the object name and kind into the object. Nothing is
+        # rendered before this loop is done, so the updated object is also
+        # used everywhere it is referenced via anchors
+        kind = obj.__j2i_kind__
         add_attr_to_obj(obj, 'keyname', name)
         add_attr_to_obj(obj, 'kind', kind)
+        for template, output_path in templates.get(kind.lower(), []):
+            if template not in compiled:
+                if template.startswith(to_ignore):
+                    compiled[template] = None
+                else:
+                    j2_env = _get_env(os.path.dirname(template),
+                                      bytecode_cache,
+                                      bytecode_cache_dir)
+                    compiled[template] = j2_env.get_template(
+                        os.path.basename(template))
+            tasks.append((os.path.join(name, output_path),
+                          obj,
+                          template,
+                          compiled[template]))
+
+    # render (and write to the zip file) the files grouped by extension,
+    # so that similar files are next to each other in the output
+    tasks.sort(key=lambda t: (os.path.splitext(t[0])[1], t[0]))
+
+    def render(task):
+        file_path, obj, template, j2_template = task
+        # render the file if it's not supposed to be ignored
+        if j2_template is None:
+            res = (template, CONTENT_FILE)
+        elif jobs > 1:
+            # render the whole file in the worker thread
+            res = parse_template(j2_template, obj=obj, params=params)
+            if res:
+                res = ([res], CONTENT_RENDERED)
+        else:
+            # the file is rendered while it is written to the zip file
+            res = stream_template(j2_template, obj=obj, params=params)
+            if res:
+                res = (res, CONTENT_RENDERED)
+        return file_path, res
 
     # render the templates for each defined object
-    content_store = {}
-    for name, obj in objs.items():
-        kind = obj.__class__.__name__.lower()
-        for template in templates.get(kind, []):
-            # render the file if it's not supposed to be ignored
-            should_ignore = reduce(
-                lambda a, b: a or b,
-                [template.startswith(x) for x in to_ignore],
-                False)
-            if should_ignore:
-                res = (template, file)
-            else:
-                res = parse_template(template, obj=obj, params=params)
-                if res:
-                    res = (res, str)
-            if res:
-                file_path = gen_output_file_path(kind,
-                                                 name,
-                                                 template,
-                                                 templates_dir_path)
-                content_store[file_path] = res
-    assert content_store, "No content could be generated"
-    return create_zip(content_store)
+    file_paths = set()
+    for file_path, res in parallel_map(render, tasks, jobs):
+        if res:
+            assert file_path not in file_paths, \
+                "Multiple templates are saved as {}".format(file_path)
+            file_paths.add(file_path)
+            yield file_path, res
+    assert file_paths, "No content could be generated"
+
+
+def parallel_map(func, iterable, jobs):
+    """Generate the results of func for each item in iterable, in order.
+    If jobs > 1, func is called in a pool of jobs threads"""
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            # closing this generator cancels the pending calls
+            yield from executor.map(func, iterable)
+    else:
+        yield from map(func, iterable)
 
 
-def write_content(content, output_file_path):
+def write_content(content, output_file_path, compresslevel=None):
     # force .zip extension on the output file
     _, ext = os.path.splitext(output_file_path)
     if ext != '.zip':
         output_file_path += '.zip'
-    with open(output_file_path, 'w') as out_file:
-        shutil.copyfileobj(content, out_file)
+    # the content is generated while the zip is written, so write it to a
+    # temp file next to the output file and only replace the output file
+    # (e.g. from a previous run) once everything was rendered
+    fd, tmp_file_path = tempfile.mkstemp(
+        dir=os.path.dirname(output_file_path) or '.', suffix='.zip')
+    os.close(fd)
+    try:
+        create_zip(content, tmp_file_path, compresslevel)
+        # mkstemp() creates the file readable by the owner only,
+        # use the same permissions open() would have used
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_file_path, 0o666 & ~umask)
+        os.replace(tmp_file_path, output_file_path)
+    except BaseException:
+        os.remove(tmp_file_path)
+        raise
     return output_file_path
 
 
 def get_files_to_be_ignored(dir_):
-    """Check dir_ for a .j2i_ignore file and ignore the files inside"""
-    res = []
+    """Check dir_ for a .j2i_ignore file and ignore the files inside.
+    The paths are returned as a tuple so they can be passed directly
+    to str.startswith()"""
     ignore_file = os.path.join(dir_, '.j2i_ignore')
     try:
-        with open(ignore_file) as f:
-            for l in f.readlines():
-                p = os.path.join(dir_, l.strip())
-                res.append(p)
-    except IOError:
-        pass
-    return res
+        with open(ignore_file, encoding='utf-8') as f:
+            lines = (l.strip() for l in f)
+            # skip the empty lines, they would ignore the whole dir_
+            return tuple(os.path.join(dir_, l) for l in lines if l)
+    except OSError:
+        return ()
 
 
 def add_attr_to_obj(obj, attr, value):
     """Creates a new attribute in the object with the given value
     If the object already has that attribute configure,
     it will try to use <attr>_, <attr>__ etc"""
-    if not hasattr(obj, attr):
-        setattr(obj, attr, value)
-    else:
-        new_attr = attr + '_'
-        add_attr_to_obj(obj, new_attr, value)
+    while attr in vars(obj):
+        attr += '_'
+    setattr(obj, attr, value)
 
 
 def get_all_templates(root_dir):
@@ -164,47 +293,106 @@ def get_all_templates(root_dir):
         ├── template1.txt.j2
         └── template2
 
-    The function will return:
+    The function will return the path to each template together with the
+    path, relative to the object name dir, to be used to save the rendered
+    template file (the jinja2 related extensions are removed):
 
-    {'bar': ['abspath/to/bar/bar_template1.j2',
-             'abspath/to/bar/bar_template2.txt.jinja2',
-             'abspath/to/bar/subbar/subbar_template.j2]
-    'foo': ['abspath/to/foo/template1.txt.j2',
-            'abspath/to/foo/template2']
+    {'bar': [('abspath/to/bar/bar_template1.j2', 'bar_template1'),
+             ('abspath/to/bar/bar_template2.txt.jinja2', 'bar_template2.txt'),
+             ('abspath/to/bar/subbar/subbar_template.j2',
+              'subbar/subbar_template')]
+    'foo': [('abspath/to/foo/template1.txt.j2', 'template1.txt'),
+            ('abspath/to/foo/template2', 'template2')]
     }
 
     :param root_dir: the directory where to start looking
     :type root_dir: str
-    :rtype: dict[str, list[str]]
+    :rtype: dict[str, list[(str, str)]]
     """
     res = {}
-    keys = None
-
-    for path, subdirs, files in os.walk(root_dir):
-        if keys is None:
-            keys = subdirs
-        for name in files:
-            # find which key (parent subdir) the file belongs to
-            for key in keys:
-                key_path = os.path.join(root_dir, key)
-                if path.startswith(key_path):
-                    file_path = os.path.join(path, name)
-                    res.setdefault(key, []).append(file_path)
+
+    with os.scandir(root_dir) as it:
+        # the files directly in root_dir do not belong to any key
+        keys = [e for e in it if e.is_dir(follow_symlinks=False)]
+
+    for key_entry in keys:
+        key_files = []
+        for path, rel_path in iter_files(key_entry.path):
+            key_files.append((path, gen_output_file_path(rel_path)))
+        if key_files:
+            res[key_entry.name] = key_files
     return res
 
 
-def parse_template(template, **kwargs):
-    """Parse the given template with Jinja2 engine
-    using the given kwargs as input"""
-    template_dir = os.path.dirname(template)
-    template_file_name = os.path.basename(template)
+def iter_files(dir_):
+    """Generate (path, path relative to dir_) for all the files below dir_.
+    As with os.walk(), symlinks to directories are not followed"""
+    dirs = [(dir_, '')]
+    while dirs:
+        path, rel_path = dirs.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                entry_rel_path = os.path.join(rel_path, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append((entry.path, entry_rel_path))
+                elif entry.is_file():
+                    yield entry.path, entry_rel_path
+
+
+@functools.lru_cache(maxsize=None)
+def _get_yaml():
+    """Create the yaml parser used to load the input file.
+    ruamel.yaml is imported here so that e.g. --help does not pay for it"""
+    from ruamel.yaml import YAML
+    from ruamel.yaml.constructor import SafeConstructor
+
+    class ObjConstructor(SafeConstructor):
+        """SafeConstructor with its own registry of tag constructors, so the
+        custom tags added for the template keys do not leak into
+        SafeConstructor (and every other safe loader in the process)"""
+        # the tags (without the leading '!') accepted by obj_constructor
+        obj_kinds = frozenset()
+
+    # a single constructor handles all the custom tags
+    ObjConstructor.add_multi_constructor('!', obj_constructor)
+
+    # the comments and formatting of the input are not needed, so use the
+    # safe loader (libyaml based if available) instead of the round-trip one
+    yaml = YAML(typ='safe', pure=False)
+    yaml.Constructor = ObjConstructor
+    return yaml
+
+
+@functools.lru_cache(maxsize=None)
+def _get_env(templates_dir, bytecode_cache=True, bytecode_cache_dir=None):
+    """Create the Jinja2 environment used to render the templates found
+    directly in templates_dir. As each template is loaded from its own dir,
+    the names used in include, import and extends are relative to the dir of
+    the rendered template. The environment (and the templates it compiles)
+    is cached so it is set up only once per dir.
+    If bytecode_cache is set, the compiled templates are also saved in
+    bytecode_cache_dir (or jinja2's default per user cache dir) so that
+    later runs do not have to compile them again"""
+    import jinja2
+
+    cache = None
+    if bytecode_cache:
+        if bytecode_cache_dir is not None:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+        cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+
     j2_env = jinja2.Environment(
-        loader=jinja2.FileSystemLoader(template_dir),
+        loader=jinja2.FileSystemLoader(templates_dir),
         trim_blocks=True,
         lstrip_blocks=True,
         keep_trailing_newline=True,
         extensions=['jinja2.ext.loopcontrols', 'jinja2.ext.do'],
         undefined=jinja2.StrictUndefined,
+        # j2i renders a static set of templates in one go: never check the
+        # template files for changes and never evict compiled templates
+        auto_reload=False,
+        cache_size=-1,
+        bytecode_cache=cache,
     )
 
     # add some useful custom filters
@@ -221,15 +409,36 @@ def parse_template(template, **kwargs):
     # add some global functions (that can be called directly)
     j2_env.globals['uuid4'] = j2_uuid4
 
-    template = j2_env.get_template(template_file_name)
+    return j2_env
+
+
+def parse_template(template, **kwargs):
+    """Render the given compiled Jinja2 template
+    using the given kwargs as input and return the utf-8 encoded result"""
     res = template.render(**kwargs)
-    return res
+    return res.encode('utf-8')
+
+
+def stream_template(template, **kwargs):
+    """Same as parse_template but return an iterator over the utf-8 encoded
+    result, which is rendered chunk by chunk while iterating.
+    None is returned if the result is empty"""
+    stream = template.stream(**kwargs)
+    stream.enable_buffering(TEMPLATE_STREAM_BUFFER_SIZE)
+    # the buffered stream only generates non empty chunks, render the first
+    # one to find out if there is any result at all
+    first_chunk = next(stream, None)
+    if first_chunk is None:
+        return None
+    return (chunk.encode('utf-8')
+            for chunk in itertools.chain([first_chunk], stream))
 
 
+@functools.lru_cache(maxsize=4096)
 def j2_uuid5(s):
     """"Jinja2 custom filter that transforms the given string into a UUID
     """
-    return uuid.uuid5(uuid.NAMESPACE_DNS, s)
+    return uuid.uuid5(UUID5_NAMESPACE, s)
 
 
 def j2_uuid4():
@@ -251,24 +460,30 @@ def j2_raise(s):
     raise Exception(s)
 
 
+@functools.lru_cache(maxsize=4096)
 def j2_ip_range(s):
     """Jinja2 custom filter that transforms an IP range string,
     e.g. 192.168.0.1-192.168.0.4, into a netaddr.IPRange()"""
+    import netaddr
     start, _, end = s.partition("-")
     return netaddr.IPRange(start, end)
 
 
+@functools.lru_cache(maxsize=4096)
 def j2_ip_network(s):
     """Jinja2 custom filter that converts a subnet in string format to
     netaddr.IPNetwork
     """
+    import netaddr
     return netaddr.IPNetwork(s)
 
 
+@functools.lru_cache(maxsize=4096)
 def j2_ip_address(s):
     """Jinja2 custom filter that converts an IP in string format to
     netaddr.IPAddress
     """
+    import netaddr
     return netaddr.IPAddress(s)
 
 
@@ -276,6 +491,7 @@ def j2_ip_set(s):
     """Jinja2 custom filter that converts a list of IP ranges in string format
     to netaddr.IPSet
     """
+    import netaddr
     return netaddr.IPSet(s)
 
 
@@ -287,44 +503,55 @@ def j2_quote(s):
 
 def j2_to_linux_if_name(s):
     """Convert the given string into a linux compatible interface name"""
-    res = []
-    for c in s:
-        if c.isalnum() or c in ['-', '_']:
-            res.append(c)
+    if s.isascii():
+        res = s.translate(LINUX_IF_NAME_DEL_TABLE)
+    else:
+        # slow path, keep the non ascii alphanumeric chars as well
+        res = ''.join(c for c in s if c.isalnum() or c in '-_')
     # the interface name in linux cannot be bigger than 15 chars
     if len(res) > 15:
         # calculate a 9 digits hash of the input string and
         # append that to the first 6 escaped chars
-        h = int(hashlib.sha256(s.encode('utf-8')).hexdigest(), 16) % 10**9
-        r = ''.join(res[:6]) + str(h)
+        digest = hashlib.sha256(s.encode('utf-8')).digest()
+        h = int.from_bytes(digest, 'big') % 10**9
+        r = res[:6] + str(h)
         assert len(r) <= 15
         return r
     else:
-        return ''.join(res)
+        return res
 
 
 class Obj(object):
-    pass
-
-
-def obj_constructor(loader, node):
-    values = CommentedMap()
-    loader.construct_mapping(node, values, deep=True)
-    kind = str(node.tag.lstrip("!"))
-    cls = type(kind, (Obj, ), values)
-    return cls()
-
-
-def gen_output_file_path(obj_kind, obj_name, template, root_dir):
-    """Generate the path to be used to save the rendered template file"""
-    # keep the directory structure from the templates dir,
-    # relative to the template key
-    common_path = os.path.join(root_dir, obj_kind)
-    rel_path = os.path.relpath(template, common_path)
-
-    file_path = os.path.join(obj_name, rel_path)
-
-    # create the file name to be used in the output
+    """An object defined in the input yaml with a custom tag, e.g. !foo.
+    The values of the yaml mapping are stored as instance attributes and
+    the tag name (the object kind) in the __j2i_kind__ slot, so that it does
+    not shadow a key of the yaml mapping like _kind"""
+    __slots__ = ('__j2i_kind__', '__dict__')
+
+    def __init__(self, kind, values):
+        self.__j2i_kind__ = kind
+        self.__dict__.update(values)
+
+
+def obj_constructor(loader, tag_suffix, node):
+    """yaml multi constructor creating an Obj for the custom tags
+    matching a template key"""
+    if tag_suffix not in loader.obj_kinds:
+        from ruamel.yaml.constructor import ConstructorError
+        raise ConstructorError(
+            None, None,
+            "could not determine a constructor for the tag {!r}"
+            .format(node.tag),
+            node.start_mark)
+    values = loader.construct_mapping(node, deep=True)
+    return Obj(str(tag_suffix), values)
+
+
+def gen_output_file_path(file_path):
+    """Generate the path, relative to the object name dir, to be used to save
+    the rendered template file. file_path is the path of the template
+    relative to the template key dir, so the directory structure from the
+    templates dir is kept"""
     # remove the jinja2 related extensions if present
     file_path_no_ext, file_ext = os.path.splitext(file_path)
     if file_ext in JINJA2_FILE_EXTENSIONS:
@@ -333,26 +560,36 @@ def gen_output_file_path(obj_kind, obj_name, template, root_dir):
     return file_path
 
 
-def create_zip(content_store):
-    """Create a zip file with the given content"""
-
-    # create an in memory file to store the zipped hot package
-    in_mem_file = StringIO()
-
-    # create the a zip file to store the content
-    zip_file = ZipFile(in_mem_file, 'w')
-
-    for file_name, content in content_store.items():
-        if content[1] == file:
-            zip_file.write(content[0], file_name)
-        elif content[1] == str:
-            zip_file.writestr(file_name.encode('utf-8'),
-                              content[0].encode('utf-8'))
-
-    zip_file.close()
-    in_mem_file.seek(0)
-
-    return in_mem_file
+def create_zip(content, output_file_path, compresslevel=None):
+    """Create a deflate compressed zip file at output_file_path with the
+    content from the given iterable of (file name, content) pairs.
+    A content is either (path to a file to be copied, CONTENT_FILE) or
+    (iterable of utf-8 encoded chunks, CONTENT_RENDERED)"""
+
+    # write the zip file directly to disk, through a large buffer
+    with open(output_file_path, 'wb',
+              buffering=OUTPUT_BUFFER_SIZE) as out_file:
+        with ZipFile(out_file, 'w',
+                     compression=ZIP_DEFLATED,
+                     compresslevel=compresslevel,
+                     allowZip64=True) as zip_file:
+            for file_name, file_content in content:
+                if file_content[1] == CONTENT_FILE:
+                    zip_file.write(file_content[0], file_name)
+                elif file_content[1] == CONTENT_RENDERED:
+                    # same entry info as ZipFile.writestr() would use.
+                    # Note: zip_file.open(file_name, 'w') is not used as it
+                    # would set the entry timestamp to 1980 and ignore the
+                    # per file permissions below
+                    zip_info = ZipInfo(file_name, time.localtime()[:6])
+                    zip_info.compress_type = zip_file.compression
+                    setattr(zip_info, ZIPINFO_COMPRESS_LEVEL_ATTR,
+                            zip_file.compresslevel)
+                    zip_info.external_attr = 0o600 << 16
+                    # the size is not known in advance, allow large entries
+                    with zip_file.open(zip_info, 'w',
+                                       force_zip64=True) as entry:
+                        entry.writelines(file_content[0])
 
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 import logging
 import tempfile
@@ -54,21 +54,163 @@ class J2iTest(_BaseTestCase):
         shutil.rmtree(self.tmp_dir)
 
     def test_examples(self):
+        self.run_example()
+
+    def test_examples_compresslevel(self):
+        output_file = os.path.join(self.tmp_dir, 'examples.zip')
+        sizes = {}
+        for level in ['0', '9']:
+            self.run_example(['--compresslevel', level])
+            with zipfile.ZipFile(output_file) as zf:
+                for zi in zf.infolist():
+                    self.assertEqual(zi.compress_type, zipfile.ZIP_DEFLATED)
+            sizes[level] = os.path.getsize(output_file)
+
+        self.assertLessEqual(sizes['9'], sizes['0'])
+
+    def test_examples_jobs(self):
+        for jobs in ['4', '0']:
+            self.run_example(['-j', jobs])
+
+    def test_examples_bytecode_cache(self):
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.run_example(['--bytecode-cache-dir', cache_dir])
+        self.assertTrue(os.listdir(cache_dir))
+
+        self.run_example(['--no-bytecode-cache'])
+
+    def test_relative_include(self):
+        # the included templates (at any depth) are looked up in the dir of
+        # the rendered template
+        output_file = self.run_templates('include', {
+            'foo/a.j2': '{% include "inc/p.inc" %}',
+            'foo/inc/p.inc': 'P{% include "q.inc" %}',
+            'foo/q.inc': 'Q{{ obj.field }}\n',
+            'foo/sub/b.j2': '{% include "part.inc" %}',
+            'foo/sub/part.inc': '{{ obj.field }}\n',
+            '.j2i_ignore': 'foo/inc\n',
+        })
+        with zipfile.ZipFile(output_file) as zf:
+            self.assertEqual(zf.read('foo/a'), b'PQvalue\n')
+            self.assertEqual(zf.read('foo/sub/b'), b'value\n')
+
+    def test_anchored_obj_attrs(self):
+        # a refers to b, which is only named after a was seen
+        output_file = self.run_templates('anchors', {
+            'foo/t.j2': '{{ obj.keyname }}'
+                        '{% if obj.ref is defined %}-{{ obj.ref.keyname }}'
+                        '{% endif %}',
+        }, 'a: !foo\n  ref: &b !foo\n    field: value\nb: *b\n')
+        with zipfile.ZipFile(output_file) as zf:
+            self.assertEqual(zf.read('a/t'), b'a-b')
+            self.assertEqual(zf.read('b/t'), b'b')
+
+    def test_no_output_on_error(self):
+        with self.assertRaises(Exception):
+            self.run_templates('failed', {
+                'foo/ok.j2': '{{ obj.field }}\n',
+                'foo/zz_fail.j2': '{{ "failed" | raise }}\n',
+            })
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tmp_dir, 'failed.zip')))
+        # no temp file is left behind either
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ['input.yaml', 'templates'])
+
+    def test_previous_output_kept_on_error(self):
+        templates = {'foo/template.j2': '{{ obj.field }}\n'}
+        output_file = self.run_templates('out', templates)
+        with open(output_file, 'rb') as f:
+            good_output = f.read()
+
+        # a failing run must not touch the output of the previous one
+        with self.assertRaises(Exception):
+            self.run_templates('out', templates,
+                               'foo: !foo\n  other_field: value\n')
+        with open(output_file, 'rb') as f:
+            self.assertEqual(f.read(), good_output)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ['input.yaml', 'out.zip', 'templates'])
+
+    def test_unknown_tag(self):
+        templates = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), 'examples/templates'))
+        input_file = os.path.join(self.tmp_dir, 'input.yaml')
+        with open(input_file, 'w') as f:
+            f.write('baz: !baz\n  field: value\n')
+
+        os.chdir(self.tmp_dir)
+        with self.assertRaisesRegex(Exception, "tag '!baz'"):
+            j2i.main(['-i', input_file, '-t', templates, '-o', 'unknown'])
+
+    def test_obj_kind_key(self):
+        obj = j2i.Obj('foo', {'_kind': 'value'})
+        self.assertEqual(obj._kind, 'value')
+        self.assertEqual(vars(obj), {'_kind': 'value'})
+
+        # the keys of the yaml object are kept and the injected kind is
+        # saved as kind_ instead
+        output_file = self.run_templates('kind', {
+            'foo/t.j2': '{{ obj._kind }} {{ obj.kind }} {{ obj.kind_ }}\n',
+        }, 'foo: !foo\n  _kind: a\n  kind: b\n')
+        with zipfile.ZipFile(output_file) as zf:
+            self.assertEqual(zf.read('foo/t'), b'a b foo\n')
+
+    def test_files_to_be_ignored(self):
+        self.assertEqual(j2i.get_files_to_be_ignored(self.tmp_dir), ())
+
+        with open(os.path.join(self.tmp_dir, '.j2i_ignore'), 'w') as f:
+            f.write('foo/bin\n\nbar/static/\n')
+        self.assertEqual(j2i.get_files_to_be_ignored(self.tmp_dir),
+                         (os.path.join(self.tmp_dir, 'foo/bin'),
+                          os.path.join(self.tmp_dir, 'bar/static/')))
+
+    def test_to_linux_if_name(self):
+        self.assertEqual(j2i.j2_to_linux_if_name('eth0'), 'eth0')
+        self.assertEqual(j2i.j2_to_linux_if_name('br-ex_1.100'), 'br-ex_1100')
+        self.assertEqual(j2i.j2_to_linux_if_name('vl\xe4n-\xe4'),
+                         'vl\xe4n-\xe4')
+        self.assertEqual(
+            j2i.j2_to_linux_if_name('a very long interface name'),
+            'averyl593145960')
+
+    def run_example(self, extra_args=None):
+        """Render the examples dir and compare it with the expected files"""
         input_file = os.path.abspath(
             os.path.join(os.path.dirname(__file__), 'examples/input.yaml'))
 
         templates = os.path.abspath(
             os.path.join(os.path.dirname(__file__), 'examples/templates'))
 
-        self.run_test('examples', input_file, templates)
+        self.run_test('examples', input_file, templates, extra_args)
+
+    def run_templates(self, tc_name, templates,
+                      input_yaml='foo: !foo\n  field: value\n'):
+        """Write the given templates ({path: content}, with '/' separated
+        paths relative to the templates dir) and input yaml to the tmp dir
+        and render them. Return the path to the output zip file"""
+        templates_dir = os.path.join(self.tmp_dir, 'templates')
+        for path, content in templates.items():
+            path = os.path.join(templates_dir, *path.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        input_file = os.path.join(self.tmp_dir, 'input.yaml')
+        with open(input_file, 'w') as f:
+            f.write(input_yaml)
+
+        os.chdir(self.tmp_dir)
+        j2i.main(['-i', input_file, '-t', templates_dir, '-o', tc_name])
+        return os.path.join(self.tmp_dir, tc_name + '.zip')
 
-    def run_test(self, tc_name, path_to_input_file, path_to_templates):
+    def run_test(self, tc_name, path_to_input_file, path_to_templates,
+                 extra_args=None):
         # create the list of arguments
         args = [
             '-i', path_to_input_file,
             '-t', path_to_templates,
             '-o', tc_name
-        ]
+        ] + (extra_args or [])
 
         exp_dir = get_path_to_expected_files(tc_name)
 
@@ -115,9 +257,9 @@ class J2iTest(_BaseTestCase):
             dir1, dir2, dirs_cmp.common_files, shallow=False)
 
         for mf in mismatch:
-            with open(os.path.join(dir1, mf)) as f:
+            with open(os.path.join(dir1, mf), encoding='utf-8') as f:
                 f1 = f.read()
-            with open(os.path.join(dir2, mf)) as f:
+            with open(os.path.join(dir2, mf), encoding='utf-8') as f:
                 f2 = f.read()
 
             self.assertEqualWithDiff(f1, f2,